@@ -1,11 +1,14 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.db import models
+from django.db.models import Count, Sum
+from django.core.exceptions import PermissionDenied
 from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 from django.urls import reverse
-from django.contrib.admin.views.main import ChangeList
 from datetime import timedelta
 from adminsortable2.admin import SortableAdminMixin
+from .fields import format_duration_hhmm
 from .models import Persona, Consorzio, Ramo, Giro, Turno, TurnoProprietario
 
 # =======================
@@ -44,6 +47,10 @@ class TurnoProprietarioInline(admin.TabularInline):
     fields = ('proprietario', 'tempo')
     autocomplete_fields = ['proprietario']
     
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'proprietario':
+            kwargs['queryset'] = Persona.objects.only('id', 'nome', 'cognome')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 # =======================
@@ -56,12 +63,13 @@ class ConsorzioAdmin(admin.ModelAdmin):
     inlines = [RamoInline]
     
     def num_rami(self, obj):
-        return obj.rami.count()
+        return obj._num_rami
     num_rami.short_description = 'N. Rami'
+    num_rami.admin_order_field = '_num_rami'
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related('rami')
+        return qs.annotate(_num_rami=Count('rami'))
 
 
 # =======================
@@ -75,18 +83,20 @@ class RamoAdmin(admin.ModelAdmin):
     autocomplete_fields = []
     inlines = [GiroInline]
     ordering = ('consorzio', 'nome')
+    list_select_related = ('consorzio',)
     
     def inizio_astratto_display(self, obj):
         return obj.inizio_astratto.strftime('%d/%m %H:%M')
     inizio_astratto_display.short_description = 'Inizio (gg/mm hh:mm)'
     
     def num_giri(self, obj):
-        return obj.giri.count()
+        return obj._num_giri
     num_giri.short_description = 'N. Giri'
+    num_giri.admin_order_field = '_num_giri'
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('consorzio').prefetch_related('giri')
+        return qs.annotate(_num_giri=Count('giri'))
 
 
 # =======================
@@ -99,6 +109,7 @@ class GiroAdmin(admin.ModelAdmin):
     search_fields = ('nome', 'ramo__nome', 'ramo__consorzio__nome')
     inlines = []
     ordering = ('ramo__consorzio', 'ramo', 'nome')
+    list_select_related = ('ramo__consorzio',)
     
     def get_ramo(self, obj):
         return obj.ramo.nome
@@ -111,19 +122,21 @@ class GiroAdmin(admin.ModelAdmin):
     get_consorzio.admin_order_field = 'ramo__consorzio__nome'
     
     def num_turni(self, obj):
-        return obj.turni.count()
+        return obj._num_turni
     num_turni.short_description = 'N. Turni'
+    num_turni.admin_order_field = '_num_turni'
     
     def durata_totale(self, obj):
-        total = sum([t.durata for t in obj.turni.all()], timedelta())
-        hours, remainder = divmod(total.total_seconds(), 3600)
-        minutes = remainder // 60
-        return f"{int(hours):02d}:{int(minutes):02d}"
+        return format_duration_hhmm(obj._durata_totale or timedelta())
     durata_totale.short_description = 'Durata Totale'
+    durata_totale.admin_order_field = '_durata_totale'
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('ramo__consorzio').prefetch_related('turni')
+        return qs.annotate(
+            _num_turni=Count('turni'),
+            _durata_totale=Sum('turni__durata'),
+        )
 
 
 # =======================
@@ -131,12 +144,13 @@ class GiroAdmin(admin.ModelAdmin):
 # =======================
 @admin.register(Turno)
 class TurnoAdmin(SortableAdminMixin, admin.ModelAdmin):
-    list_display = ('ordine', 'get_giro_completo', 'utilizzatore', 'durata')
+    list_display = ('ordine', 'get_giro_completo', 'utilizzatore', 'durata_hhmm')
     list_display_links = ('get_giro_completo', 'utilizzatore')
     list_filter = ('giro__ramo__consorzio', 'giro__ramo', 'giro')
     search_fields = ('utilizzatore__nome', 'utilizzatore__cognome')
     autocomplete_fields = ['utilizzatore']
     list_per_page = 100
+    list_select_related = ('utilizzatore', 'giro__ramo__consorzio')
     inlines = [TurnoProprietarioInline]
     
     # Specifica il campo da usare per l'ordinamento
@@ -147,52 +161,62 @@ class TurnoAdmin(SortableAdminMixin, admin.ModelAdmin):
             'fields': ('giro', 'ordine', 'utilizzatore')
         }),
         ('Durata', {
-            'fields': ('durata',)
+            'fields': ('durata_hhmm',)
         }),
     )
     
-    readonly_fields = ('durata', 'ordine')
+    readonly_fields = ('durata_hhmm', 'ordine')
     
     def get_giro_completo(self, obj):
         return str(obj.giro)
     get_giro_completo.short_description = 'Giro'
     get_giro_completo.admin_order_field = 'giro'
     
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        qs = qs.select_related('utilizzatore', 'giro__ramo__consorzio')
-        return qs
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # str(giro) attraversa ramo e consorzio per ogni opzione della select
+        if db_field.name == 'giro':
+            kwargs['queryset'] = Giro.objects.select_related('ramo__consorzio')
+        elif db_field.name == 'utilizzatore':
+            kwargs['queryset'] = Persona.objects.only('id', 'nome', 'cognome')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
+    def durata_hhmm(self, obj):
+        return format_duration_hhmm(obj.durata)
+    durata_hhmm.short_description = 'Durata'
+    durata_hhmm.admin_order_field = 'durata'
     
     def changelist_view(self, request, extra_context=None):
-        """Mostra un messaggio se non è selezionato un giro"""
+        """Mostra l'elenco dei giri se non è selezionato un giro"""
         extra_context = extra_context or {}
         
         giro_id = request.GET.get('giro__id__exact')
-        if giro_id:
-            try:
-                giro = Giro.objects.select_related('ramo__consorzio').get(pk=giro_id)
-                extra_context['giro_selezionato'] = giro
-                extra_context['title'] = f'Turni - {giro}'
-            except Giro.DoesNotExist:
-                pass
-        else:
-            extra_context['title'] = 'Turni - Seleziona un Giro'
+        if not giro_id:
+            # Nessun giro: evita la ChangeList (count e opzioni dei filtri)
+            if not self.has_view_or_change_permission(request):
+                raise PermissionDenied
+            context = {
+                **self.admin_site.each_context(request),
+                'opts': self.opts,
+                'title': 'Turni - Seleziona un Giro',
+                'giri': Giro.objects.select_related('ramo__consorzio').order_by(
+                    'ramo__consorzio__nome', 'ramo__nome', 'ramo', 'ordine'
+                ),
+                'has_add_permission': self.has_add_permission(request),
+                **extra_context,
+            }
+            request.current_app = self.admin_site.name
+            return TemplateResponse(request, 'admin/core/turno/select_giro.html', context)
+        
+        try:
+            giro = Giro.objects.select_related('ramo__consorzio').get(pk=giro_id)
+            extra_context['giro_selezionato'] = giro
+            extra_context['title'] = f'Turni - {giro}'
+        except Giro.DoesNotExist:
+            pass
         
-        # Applica il filtro al queryset per la changelist
         self.request = request
         return super().changelist_view(request, extra_context)
     
-    def get_changelist(self, request, **kwargs):        
-        class FilteredChangeList(ChangeList):
-            def get_queryset(self, request):
-                qs = super().get_queryset(request)
-                giro_id = request.GET.get('giro__id__exact')
-                if not giro_id:
-                    return qs.none()
-                return qs
-        
-        return FilteredChangeList
-    
     def response_add(self, request, obj, post_url_continue=None):
         """Preserva il filtro del giro dopo l'aggiunta"""
         response = super().response_add(request, obj, post_url_continue)
@@ -4,24 +4,17 @@ from datetime import timedelta
 import re
 
 
+# Pattern per hh:mm (ore possono essere più di 24)
+_HHMM_RE = re.compile(r'^(\d+):([0-5]?\d)$')
+
+
 def format_duration_hhmm(duration):
     """Formatta un timedelta come hh:mm"""
     if duration is None:
         return "00:00"
-    total_seconds = int(duration.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    return f"{hours:02d}:{minutes:02d}"
-
-
-class DurationHHMM(timedelta):
-    """Sottoclasse di timedelta che mostra sempre il formato hh:mm"""
-    
-    def __str__(self):
-        return format_duration_hhmm(self)
-    
-    def __repr__(self):
-        return f"DurationHHMM({format_duration_hhmm(self)})"
+    # Aritmetica intera su days/seconds: evita il float di total_seconds()
+    hours, remainder = divmod(duration.days * 86400 + duration.seconds, 3600)
+    return f"{hours:02d}:{remainder // 60:02d}"
 
 
 class DurationHHMMWidget(forms.TextInput):
@@ -51,11 +44,9 @@ class DurationHHMMFormField(forms.DurationField):
         if value in (None, ''):
             return None
         if isinstance(value, timedelta):
-            return DurationHHMM(seconds=value.total_seconds())
+            return value
         
-        # Pattern per hh:mm (ore possono essere più di 24)
-        pattern = r'^(\d+):([0-5]?\d)$'
-        match = re.match(pattern, str(value).strip())
+        match = _HHMM_RE.match(str(value).strip())
         
         if not match:
             raise forms.ValidationError(
@@ -64,7 +55,7 @@ class DurationHHMMFormField(forms.DurationField):
         
         hours = int(match.group(1))
         minutes = int(match.group(2))
-        return DurationHHMM(hours=hours, minutes=minutes)
+        return timedelta(hours=hours, minutes=minutes)
     
     def prepare_value(self, value):
         if isinstance(value, timedelta):
@@ -85,28 +76,6 @@ class DurationHHMMField(models.DurationField):
         defaults.update(kwargs)
         return super().formfield(**defaults)
     
-    def from_db_value(self, value, expression, connection):
-        """Converte il valore dal DB in DurationHHMM"""
-        if value is None:
-            return None
-        if isinstance(value, timedelta):
-            return DurationHHMM(seconds=value.total_seconds())
-        return value
-    
-    def to_python(self, value):
-        """Converte qualsiasi valore in DurationHHMM"""
-        if value is None:
-            return None
-        if isinstance(value, DurationHHMM):
-            return value
-        if isinstance(value, timedelta):
-            return DurationHHMM(seconds=value.total_seconds())
-        # Delega al parent per parsing stringhe standard
-        parsed = super().to_python(value)
-        if parsed is not None:
-            return DurationHHMM(seconds=parsed.total_seconds())
-        return None
-    
     def value_to_string(self, obj):
         """Per serializzazione"""
         value = self.value_from_object(obj)
@@ -1,31 +1,74 @@
 from __future__ import annotations
 
-import re
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
-from django.db.models import F, Sum
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
 from django.utils import timezone
 
-from core.models import Consorzio, Giro, Persona, Ramo, Turno, TurnoProprietario
-
-
-_TIME_RE = re.compile(r"^(?P<hours>\d+):(?P<minutes>[0-5]\d):(?P<seconds>[0-5]\d)$")
+from core.models import (
+    Consorzio,
+    Giro,
+    Persona,
+    Ramo,
+    Turno,
+    TurnoProprietario,
+    ricalcolo_durata_sospeso,
+)
 
 
 def _parse_hhmmss(raw: str, *, context: str) -> timedelta:
-    match = _TIME_RE.match((raw or "").strip())
-    if not match:
-        raise CommandError(f"Invalid time format '{raw}' for {context}. Expected HH:MM:SS.")
-
-    hours = int(match.group("hours"))
-    minutes = int(match.group("minutes"))
-    seconds = int(match.group("seconds"))
-    return timedelta(hours=hours, minutes=minutes, seconds=seconds)
+    parts = (raw or "").strip().split(":")
+    if len(parts) == 3 and all(part.isdecimal() for part in parts):
+        hours, minutes, seconds = (int(part) for part in parts)
+        if len(parts[1]) == 2 and len(parts[2]) == 2 and minutes < 60 and seconds < 60:
+            return timedelta(hours=hours, minutes=minutes, seconds=seconds)
+    raise CommandError(f"Invalid time format '{raw}' for {context}. Expected HH:MM:SS.")
+
+
+# SQLite's TRIM(x) only strips spaces; these are the ASCII characters that
+# str.strip() removes, so legacy values with a trailing tab or CR still map
+# to the same ramo and giro.
+_SQL_WHITESPACE = "char(9, 10, 11, 12, 13, 28, 29, 30, 31, 32)"
+
+# Only the first few remapped ordini are listed in the report; the rest are
+# just counted.
+_MAX_REMAPPED_EXAMPLES = 20
+
+# The import can always be re-run from the legacy file, so for its duration
+# SQLite is allowed to skip fsyncs and keep its rollback journal in memory.
+_BULK_IMPORT_PRAGMAS = {
+    "synchronous": "OFF",
+    "journal_mode": "MEMORY",
+    "temp_store": "MEMORY",
+    "cache_size": "-200000",
+}
+
+
+@contextmanager
+def _bulk_import_pragmas():
+    # PRAGMA synchronous/journal_mode cannot be changed inside a transaction.
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        yield
+        return
+
+    previous: dict[str, object] = {}
+    with connection.cursor() as cursor:
+        for name, value in _BULK_IMPORT_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}")
+            previous[name] = cursor.fetchone()[0]
+            cursor.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
 
 
 class Command(BaseCommand):
@@ -63,86 +106,76 @@ class Command(BaseCommand):
         reset = not options["no_reset"]
 
         conn = sqlite3.connect(source)
-        conn.row_factory = sqlite3.Row
 
         try:
-            persone_rows = conn.execute("SELECT id, nome FROM persona ORDER BY id").fetchall()
-            giro_rows = conn.execute(
-                """
-                SELECT id, ramo_bealera, tipo_giro, ordine, id_utilizzatore, int_tempo
+            ramo_tipi = conn.execute(
+                f"""
+                SELECT DISTINCT
+                  TRIM(ramo_bealera, {_SQL_WHITESPACE}),
+                  TRIM(tipo_giro, {_SQL_WHITESPACE})
                 FROM giro
-                ORDER BY id
-                """
-            ).fetchall()
-            ruolo_rows = conn.execute(
-                """
-                SELECT id, id_giro, id_utente, intervallo_tempo
-                FROM ruolo
-                ORDER BY id
+                ORDER BY 1, 2
                 """
             ).fetchall()
 
-            with transaction.atomic():
+            with _bulk_import_pragmas(), ricalcolo_durata_sospeso(), transaction.atomic():
                 if reset:
                     self.stdout.write("Reset enabled: deleting existing core data...")
-                    TurnoProprietario.objects.all().delete()
-                    Turno.objects.all().delete()
-                    Giro.objects.all().delete()
-                    Ramo.objects.all().delete()
-                    Consorzio.objects.all().delete()
-                    Persona.objects.all().delete()
+                    # Plain DELETE FROM in dependency order, so Django's
+                    # delete collector and per-row signals are skipped.
+                    with connection.cursor() as cursor:
+                        for model in (TurnoProprietario, Turno, Giro, Ramo, Consorzio, Persona):
+                            cursor.execute(
+                                f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}"
+                            )
 
                 consorzio, _ = Consorzio.objects.get_or_create(
                     nome=consorzio_name,
                     defaults={"descrizione": "Import legacy chiamogna.sqlite3"},
                 )
 
-                legacy_persona_to_new: dict[int, Persona] = {}
-                persone_created = 0
-                for row in persone_rows:
-                    legacy_id = int(row["id"])
-                    cognome = (row["nome"] or "").strip() or "-"
-                    persona = Persona.objects.create(nome="-", cognome=cognome)
-                    legacy_persona_to_new[legacy_id] = persona
-                    persone_created += 1
+                cognomi = [
+                    (legacy_id, (nome or "").strip() or "-")
+                    for legacy_id, nome in conn.execute("SELECT id, nome FROM persona ORDER BY id")
+                ]
+                new_personas = [Persona(nome="-", cognome=cognome) for _, cognome in cognomi]
+                Persona.objects.bulk_create(new_personas, batch_size=1000)
+                legacy_persona_to_new: dict[int, int] = {
+                    legacy_id: persona.pk
+                    for (legacy_id, _), persona in zip(cognomi, new_personas)
+                }
+                persone_created = len(new_personas)
 
                 tz = timezone.get_current_timezone()
                 inizio_astratto = timezone.make_aware(datetime(2000, 1, 1, 0, 0, 0), tz)
 
-                ramo_map: dict[str, Ramo] = {}
-                ramo_names = sorted({str(row["ramo_bealera"]).strip() for row in giro_rows})
-                rami_created = 0
-                for ramo_name in ramo_names:
-                    ramo = Ramo.objects.create(
+                ramo_names = list(dict.fromkeys(ramo_name for ramo_name, _ in ramo_tipi))
+                new_rami = [
+                    Ramo(
                         nome=ramo_name,
                         descrizione="",
                         consorzio=consorzio,
                         inizio_astratto=inizio_astratto,
                     )
-                    ramo_map[ramo_name] = ramo
-                    rami_created += 1
+                    for ramo_name in ramo_names
+                ]
+                Ramo.objects.bulk_create(new_rami, batch_size=500)
+                ramo_map: dict[str, Ramo] = dict(zip(ramo_names, new_rami))
+                rami_created = len(new_rami)
 
-                giro_map: dict[tuple[str, str], Giro] = {}
-                giri_created = 0
+                new_giri: list[Giro] = []
                 tipo_order_fallback = 3
-                for ramo_name in ramo_names:
-                    tipi = sorted(
-                        {
-                            str(row["tipo_giro"]).strip()
-                            for row in giro_rows
-                            if str(row["ramo_bealera"]).strip() == ramo_name
-                        }
-                    )
-                    for tipo in tipi:
-                        if tipo == "A":
-                            ordine = 1
-                        elif tipo == "B":
-                            ordine = 2
-                        else:
-                            ordine = tipo_order_fallback
-                            tipo_order_fallback += 1
-
-                        giro = Giro.objects.create(
+                for ramo_name, tipo in ramo_tipi:
+                    if tipo == "A":
+                        ordine = 1
+                    elif tipo == "B":
+                        ordine = 2
+                    else:
+                        ordine = tipo_order_fallback
+                        tipo_order_fallback += 1
+
+                    new_giri.append(
+                        Giro(
                             nome=f"Giro {tipo}",
                             ordine=ordine,
                             descrizione=(
@@ -150,25 +183,42 @@ class Command(BaseCommand):
                             ),
                             ramo=ramo_map[ramo_name],
                         )
-                        giro_map[(ramo_name, tipo)] = giro
-                        giri_created += 1
+                    )
+                Giro.objects.bulk_create(new_giri, batch_size=500)
+                giro_map: dict[tuple[str, str], Giro] = dict(zip(ramo_tipi, new_giri))
+                giri_created = len(new_giri)
 
-                legacy_giro_to_turno: dict[int, Turno] = {}
-                turni_created = 0
+                legacy_giro_ids: list[int] = []
+                new_turni: list[Turno] = []
                 skipped_missing_utilizzatore = 0
                 skipped_missing_giro_key = 0
                 remapped_duplicate_ordine = 0
                 remapped_examples: list[str] = []
-                used_ordini_by_giro: dict[int, set[int]] = {}
-                for row in giro_rows:
-                    legacy_giro_id = int(row["id"])
-                    ramo_name = str(row["ramo_bealera"]).strip()
-                    tipo = str(row["tipo_giro"]).strip()
-                    requested_ordine = int(row["ordine"])
-                    legacy_utilizzatore_id = int(row["id_utilizzatore"])
-
-                    utilizzatore = legacy_persona_to_new.get(legacy_utilizzatore_id)
-                    if not utilizzatore:
+                # Per giro: taken ordine -> next candidate slot. Chains are
+                # compressed so repeated collisions on a run stay O(1).
+                next_free_by_giro: dict[int, dict[int, int]] = {}
+                giro_rows = conn.execute(
+                    f"""
+                    SELECT
+                      id,
+                      TRIM(ramo_bealera, {_SQL_WHITESPACE}),
+                      TRIM(tipo_giro, {_SQL_WHITESPACE}),
+                      ordine,
+                      id_utilizzatore
+                    FROM giro
+                    ORDER BY id
+                    """
+                )
+                for (
+                    legacy_giro_id,
+                    ramo_name,
+                    tipo,
+                    requested_ordine,
+                    legacy_utilizzatore_id,
+                ) in giro_rows:
+
+                    utilizzatore_pk = legacy_persona_to_new.get(legacy_utilizzatore_id)
+                    if utilizzatore_pk is None:
                         skipped_missing_utilizzatore += 1
                         self.stderr.write(
                             self.style.WARNING(
@@ -187,39 +237,78 @@ class Command(BaseCommand):
                         )
                         continue
 
-                    used_ordini = used_ordini_by_giro.setdefault(giro.pk, set())
+                    next_free = next_free_by_giro.setdefault(giro.pk, {})
                     ordine = requested_ordine
-                    while ordine in used_ordini:
-                        ordine += 1
-                    if ordine != requested_ordine:
+                    if ordine in next_free:
+                        taken: list[int] = []
+                        while ordine in next_free:
+                            taken.append(ordine)
+                            ordine = next_free[ordine]
+                        for slot in taken:
+                            next_free[slot] = ordine + 1
                         remapped_duplicate_ordine += 1
-                        remapped_examples.append(
-                            f"legacy_giro_id={legacy_giro_id} ({ramo_name}/{tipo}): {requested_ordine}->{ordine}"
-                        )
-                    used_ordini.add(ordine)
+                        if len(remapped_examples) < _MAX_REMAPPED_EXAMPLES:
+                            remapped_examples.append(
+                                f"legacy_giro_id={legacy_giro_id} ({ramo_name}/{tipo}): {requested_ordine}->{ordine}"
+                            )
+                    next_free[ordine] = ordine + 1
 
-                    turno = Turno.objects.create(
-                        utilizzatore=utilizzatore,
-                        ordine=ordine,
-                        giro=giro,
+                    legacy_giro_ids.append(legacy_giro_id)
+                    new_turni.append(
+                        Turno(
+                            utilizzatore_id=utilizzatore_pk,
+                            ordine=ordine,
+                            giro_id=giro.pk,
+                        )
                     )
-                    legacy_giro_to_turno[legacy_giro_id] = turno
-                    turni_created += 1
 
-                turnoproprietari_created = 0
+                Turno.objects.bulk_create(new_turni, batch_size=1000)
+                legacy_giro_to_turno: dict[int, int] = dict(
+                    zip(legacy_giro_ids, (turno.pk for turno in new_turni))
+                )
+                turni_created = len(new_turni)
+
+                tempo_field = TurnoProprietario._meta.get_field("tempo")
+                turnoproprietario_rows: list[tuple] = []
                 skipped_missing_turno = 0
                 skipped_missing_proprietario = 0
-                for row in ruolo_rows:
-                    ruolo_id = int(row["id"])
-                    legacy_giro_id = int(row["id_giro"])
-                    legacy_proprietario_id = int(row["id_utente"])
-                    tempo = _parse_hhmmss(
-                        str(row["intervallo_tempo"]),
-                        context=f"ruolo id={ruolo_id}",
-                    )
+                # Well-formed HH:MM:SS values are converted to seconds by SQLite;
+                # anything else comes back as NULL and goes through _parse_hhmmss,
+                # which rejects it with the usual error.
+                ruolo_rows = conn.execute(
+                    """
+                    SELECT
+                      id,
+                      id_giro,
+                      id_utente,
+                      intervallo_tempo,
+                      CASE
+                        WHEN TRIM(intervallo_tempo) GLOB '[0-9][0-9]:[0-5][0-9]:[0-5][0-9]'
+                        THEN CAST(substr(TRIM(intervallo_tempo), 1, 2) AS INTEGER) * 3600
+                           + CAST(substr(TRIM(intervallo_tempo), 4, 2) AS INTEGER) * 60
+                           + CAST(substr(TRIM(intervallo_tempo), 7, 2) AS INTEGER)
+                      END AS tempo_sec
+                    FROM ruolo
+                    ORDER BY id
+                    """
+                )
+                for (
+                    ruolo_id,
+                    legacy_giro_id,
+                    legacy_proprietario_id,
+                    intervallo_tempo,
+                    tempo_sec,
+                ) in ruolo_rows:
+                    if tempo_sec is not None:
+                        tempo = timedelta(seconds=tempo_sec)
+                    else:
+                        tempo = _parse_hhmmss(
+                            str(intervallo_tempo),
+                            context=f"ruolo id={ruolo_id}",
+                        )
 
-                    turno = legacy_giro_to_turno.get(legacy_giro_id)
-                    if not turno:
+                    turno_pk = legacy_giro_to_turno.get(legacy_giro_id)
+                    if turno_pk is None:
                         skipped_missing_turno += 1
                         self.stderr.write(
                             self.style.WARNING(
@@ -228,8 +317,8 @@ class Command(BaseCommand):
                         )
                         continue
 
-                    proprietario = legacy_persona_to_new.get(legacy_proprietario_id)
-                    if not proprietario:
+                    proprietario_pk = legacy_persona_to_new.get(legacy_proprietario_id)
+                    if proprietario_pk is None:
                         skipped_missing_proprietario += 1
                         self.stderr.write(
                             self.style.WARNING(
@@ -238,14 +327,37 @@ class Command(BaseCommand):
                         )
                         continue
 
-                    TurnoProprietario.objects.create(
-                        turno=turno,
-                        proprietario=proprietario,
-                        tempo=tempo,
+                    turnoproprietario_rows.append(
+                        (
+                            turno_pk,
+                            proprietario_pk,
+                            tempo_field.get_db_prep_value(tempo, connection),
+                        )
                     )
-                    turnoproprietari_created += 1
 
-                turni_without_owner = Turno.objects.filter(turnoproprietario__isnull=True).count()
+                # Plain executemany() skips model instantiation entirely; it
+                # sends no post_save signals either, so durata is recomputed
+                # once for all imported turni below.
+                opts = TurnoProprietario._meta
+                quote_name = connection.ops.quote_name
+                insert_sql = "INSERT INTO {} ({}, {}, {}) VALUES (%s, %s, %s)".format(
+                    quote_name(opts.db_table),
+                    quote_name(opts.get_field("turno").column),
+                    quote_name(opts.get_field("proprietario").column),
+                    quote_name(tempo_field.column),
+                )
+                with connection.cursor() as cursor:
+                    cursor.executemany(insert_sql, turnoproprietario_rows)
+                turnoproprietari_created = len(turnoproprietario_rows)
+
+                Turno.ricalcola_durata_bulk(
+                    Turno.objects.filter(giro__in=giro_map.values()).values("pk")
+                )
+
+                report = Turno.objects.annotate(total=Sum("turnoproprietario__tempo")).aggregate(
+                    without_owner=Count("pk", filter=Q(total__isnull=True)),
+                    mismatched_durata=Count("pk", filter=~Q(durata=F("total"))),
+                )
 
                 self.stdout.write(self.style.SUCCESS("Import completed."))
                 self.stdout.write("Imported counts:")
@@ -266,13 +378,11 @@ class Command(BaseCommand):
                     self.stdout.write("- Duplicate ordine examples:")
                     for example in remapped_examples:
                         self.stdout.write(f"  - {example}\n")
-                self.stdout.write(f"- Turni without proprietario: {turni_without_owner}")
-
-                mismatched_durata = (
-                    Turno.objects.annotate(total=Sum("turnoproprietario__tempo"))
-                    .exclude(durata=F("total"))
-                    .count()
-                )
-                self.stdout.write(f"- Turni with durata mismatch: {mismatched_durata}")
+                    if remapped_duplicate_ordine > len(remapped_examples):
+                        self.stdout.write(
+                            f"  (and {remapped_duplicate_ordine - len(remapped_examples)} more)"
+                        )
+                self.stdout.write(f"- Turni without proprietario: {report['without_owner']}")
+                self.stdout.write(f"- Turni with durata mismatch: {report['mismatched_durata']}")
         finally:
             conn.close()
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-15 21:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_turno_durata_alter_turnoproprietario_tempo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='giro',
+            index=models.Index(fields=['ramo', 'ordine'], name='core_giro_ramo_id_5c3e19_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ramo',
+            index=models.Index(fields=['consorzio', 'nome'], name='core_ramo_consorz_0450a2_idx'),
+        ),
+    ]
@@ -1,8 +1,13 @@
 import logging
+import threading
+from contextlib import contextmanager
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from datetime import timedelta
-from .fields import DurationHHMMField
+from .fields import DurationHHMMField, format_duration_hhmm
 
 # Create your models here.
 class Persona(models.Model):
@@ -43,6 +48,7 @@ class Ramo(models.Model):
     class Meta:
         verbose_name_plural = "Rami"
         ordering = ['consorzio', 'nome']
+        indexes = [models.Index(fields=['consorzio', 'nome'])]
 
     def __str__(self):
         return self.nome
@@ -56,6 +62,7 @@ class Giro(models.Model):
     class Meta:
         verbose_name_plural = "Giri"
         ordering = ['ramo', 'nome']
+        indexes = [models.Index(fields=['ramo', 'ordine'])]
 
     def __str__(self):
         return f"{self.ramo.consorzio.nome} - {self.ramo.nome} - {self.nome}"
@@ -73,7 +80,7 @@ class Turno(models.Model):
         unique_together = [['giro', 'ordine']]
 
     def __str__(self):
-        return f"Turno {self.ordine} - {self.utilizzatore.nome} ({self.durata})"
+        return f"Turno {self.ordine} - {self.utilizzatore.nome} ({format_duration_hhmm(self.durata)})"
     
     def clean(self):
         """Valida che il turno abbia almeno un proprietario"""
@@ -94,6 +101,19 @@ class Turno(models.Model):
         Turno.objects.filter(pk=self.pk).update(durata=total_durata)
         # Aggiorna l'istanza corrente
         self.durata = total_durata
+    
+    @classmethod
+    def ricalcola_durata_bulk(cls, turno_ids):
+        """Ricalcola la durata di più turni con un solo UPDATE (turno_ids può essere anche un queryset di pk)"""
+        totale_tempo = (
+            TurnoProprietario.objects.filter(turno=models.OuterRef('pk'))
+            .values('turno')
+            .annotate(totale=models.Sum('tempo'))
+            .values('totale')
+        )
+        return cls.objects.filter(pk__in=turno_ids).update(
+            durata=Coalesce(models.Subquery(totale_tempo), models.Value(timedelta(0)))
+        )
 
 
 class TurnoProprietario(models.Model):
@@ -110,18 +130,42 @@ class TurnoProprietario(models.Model):
         unique_together = [['turno', 'proprietario']]
     
     def __str__(self):
-        hours, remainder = divmod(self.tempo.total_seconds(), 3600)
-        minutes = remainder // 60
-        return f"{self.proprietario} - {int(hours):02d}:{int(minutes):02d}"
-    
-    def save(self, *args, **kwargs):
-        """Salva e ricalcola la durata totale del turno"""
-        logging.debug(f"Salvataggio TurnoProprietario: Turno {self.turno.pk}, Proprietario {self.proprietario.pk}, Tempo {self.tempo}")
-        super().save(*args, **kwargs)
-        self.turno.ricalcola_durata()
-    
-    def delete(self, *args, **kwargs):
-        """Elimina e ricalcola la durata totale del turno"""
-        turno = self.turno
-        super().delete(*args, **kwargs)
-        turno.ricalcola_durata()
\ No newline at end of file
+        return f"{self.proprietario} - {format_duration_hhmm(self.tempo)}"
+
+
+# Stato per thread: le operazioni massive possono sospendere il ricalcolo
+# automatico e chiamare Turno.ricalcola_durata_bulk() una volta sola alla fine.
+_ricalcolo_durata = threading.local()
+
+
+@contextmanager
+def ricalcolo_durata_sospeso():
+    """Sospende il ricalcolo della durata a ogni salvataggio/eliminazione di TurnoProprietario"""
+    precedente = getattr(_ricalcolo_durata, 'sospeso', False)
+    _ricalcolo_durata.sospeso = True
+    try:
+        yield
+    finally:
+        _ricalcolo_durata.sospeso = precedente
+
+
+# Eliminazioni a cascata partite da questi modelli cancellano anche il turno:
+# ricalcolarne la durata per ogni proprietario sarebbe lavoro buttato.
+_ORIGINI_CHE_ELIMINANO_IL_TURNO = (Turno, Giro, Ramo, Consorzio)
+
+
+@receiver(post_save, sender=TurnoProprietario)
+@receiver(post_delete, sender=TurnoProprietario)
+def aggiorna_durata_turno(sender, instance, **kwargs):
+    """Ricalcola la durata totale del turno dopo ogni modifica dei proprietari"""
+    if getattr(_ricalcolo_durata, 'sospeso', False):
+        return
+    origin = kwargs.get('origin')
+    origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    if issubclass(origin_model, _ORIGINI_CHE_ELIMINANO_IL_TURNO):
+        return
+    logging.debug(
+        f"Modificato TurnoProprietario: Turno {instance.turno_id}, "
+        f"Proprietario {instance.proprietario_id}, Tempo {instance.tempo}"
+    )
+    instance.turno.ricalcola_durata()
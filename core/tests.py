@@ -1,14 +1,28 @@
+import importlib.util
 import sqlite3
 import tempfile
+from datetime import datetime, timedelta, timezone
 from io import StringIO
 from pathlib import Path
 
+from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.core.management.base import CommandError
+from django.db import connection
 from django.db.models import Sum
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from core.models import Consorzio, Giro, Persona, Ramo, Turno, TurnoProprietario
+from core.models import (
+    Consorzio,
+    Giro,
+    Persona,
+    Ramo,
+    Turno,
+    TurnoProprietario,
+    ricalcolo_durata_sospeso,
+)
 
 
 def _create_legacy_db(db_path: Path, *, include_duplicate=False):
@@ -125,6 +139,224 @@ class ImportChiamognaCommandTests(TestCase):
         )
         self.assertEqual(ordini, [30, 60, 61])
 
+    def test_invalid_time_raises_command_error(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir) / "legacy.sqlite3"
+            _create_legacy_db(source)
+            conn = sqlite3.connect(source)
+            conn.execute("UPDATE ruolo SET intervallo_tempo = '01:75:00' WHERE id = 4")
+            conn.commit()
+            conn.close()
+
+            with self.assertRaisesMessage(CommandError, "ruolo id=4"):
+                call_command("import_chiamogna", source=str(source), stdout=StringIO())
+
+    def test_trailing_whitespace_keys_are_merged(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir) / "legacy.sqlite3"
+            _create_legacy_db(source)
+            conn = sqlite3.connect(source)
+            conn.execute(
+                "UPDATE giro SET ramo_bealera = 'BOSCHETTO' || char(9, 13), "
+                "tipo_giro = 'A' || char(9) WHERE id = 11"
+            )
+            conn.commit()
+            conn.close()
+
+            call_command("import_chiamogna", source=str(source), stdout=StringIO())
+
+        self.assertEqual(Ramo.objects.count(), 2)
+        self.assertEqual(Giro.objects.count(), 2)
+        self.assertEqual(Turno.objects.filter(giro__ramo__nome="BOSCHETTO").count(), 2)
+
     def test_missing_source_raises_command_error(self):
         with self.assertRaises(CommandError):
             call_command("import_chiamogna", source="/tmp/definitely-missing-file.sqlite3")
+
+
+def _create_turno():
+    mario = Persona.objects.create(nome="Mario", cognome="Rossi")
+    consorzio = Consorzio.objects.create(nome="Chiamogna")
+    ramo = Ramo.objects.create(
+        nome="BOSCHETTO",
+        consorzio=consorzio,
+        inizio_astratto=datetime(2000, 1, 1, tzinfo=timezone.utc),
+    )
+    giro = Giro.objects.create(nome="Giro A", ordine=1, ramo=ramo)
+    return Turno.objects.create(utilizzatore=mario, ordine=10, giro=giro)
+
+
+class TurnoDurataTests(TestCase):
+    def setUp(self):
+        self.turno = _create_turno()
+        self.mario = self.turno.utilizzatore
+        self.luigi = Persona.objects.create(nome="Luigi", cognome="Bianchi")
+
+    def test_durata_follows_proprietari_changes(self):
+        tp = TurnoProprietario.objects.create(
+            turno=self.turno, proprietario=self.mario, tempo=timedelta(hours=1)
+        )
+        TurnoProprietario.objects.create(
+            turno=self.turno, proprietario=self.luigi, tempo=timedelta(minutes=30)
+        )
+        self.turno.refresh_from_db()
+        self.assertEqual(self.turno.durata, timedelta(hours=1, minutes=30))
+
+        tp.tempo = timedelta(hours=2)
+        tp.save()
+        self.turno.refresh_from_db()
+        self.assertEqual(self.turno.durata, timedelta(hours=2, minutes=30))
+
+        tp.delete()
+        self.turno.refresh_from_db()
+        self.assertEqual(self.turno.durata, timedelta(minutes=30))
+
+    def test_suspended_recalc_then_bulk(self):
+        with ricalcolo_durata_sospeso():
+            TurnoProprietario.objects.create(
+                turno=self.turno, proprietario=self.mario, tempo=timedelta(hours=1)
+            )
+        self.turno.refresh_from_db()
+        self.assertEqual(self.turno.durata, timedelta(0))
+
+        Turno.ricalcola_durata_bulk([self.turno.pk])
+        self.turno.refresh_from_db()
+        self.assertEqual(self.turno.durata, timedelta(hours=1))
+
+    def test_cascade_delete_does_not_recalc_per_proprietario(self):
+        TurnoProprietario.objects.create(
+            turno=self.turno, proprietario=self.mario, tempo=timedelta(hours=1)
+        )
+        altro = _create_turno()
+        with ricalcolo_durata_sospeso():
+            turni = [altro] + [
+                Turno.objects.create(utilizzatore=self.mario, ordine=ordine, giro=altro.giro)
+                for ordine in range(11, 15)
+            ]
+            for turno in turni:
+                for persona in (self.mario, self.luigi):
+                    TurnoProprietario.objects.create(
+                        turno=turno, proprietario=persona, tempo=timedelta(minutes=15)
+                    )
+
+        # Un consorzio con 1 TurnoProprietario e uno con 10: senza il controllo
+        # su origin ogni TurnoProprietario eliminato costerebbe 3 query in più.
+        with CaptureQueriesContext(connection) as uno:
+            self.turno.giro.ramo.consorzio.delete()
+        with CaptureQueriesContext(connection) as dieci:
+            altro.giro.ramo.consorzio.delete()
+        self.assertEqual(len(dieci), len(uno))
+        self.assertFalse(TurnoProprietario.objects.exists())
+
+    def test_deleting_a_proprietario_still_recalcs(self):
+        TurnoProprietario.objects.create(
+            turno=self.turno, proprietario=self.mario, tempo=timedelta(hours=1)
+        )
+        TurnoProprietario.objects.create(
+            turno=self.turno, proprietario=self.luigi, tempo=timedelta(minutes=30)
+        )
+        self.luigi.delete()
+        self.turno.refresh_from_db()
+        self.assertEqual(self.turno.durata, timedelta(hours=1))
+
+
+class TurnoAdminChangelistTests(TestCase):
+    def setUp(self):
+        self.url = reverse("admin:core_turno_changelist")
+        self.giro_a = _create_turno().giro
+        self.giro_b = Giro.objects.create(nome="Giro B", ordine=2, ramo=self.giro_a.ramo)
+
+    def test_without_giro_shows_giro_picker(self):
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "admin/core/turno/select_giro.html")
+        self.assertContains(response, "Chiamogna - BOSCHETTO")
+        self.assertContains(response, f'href="?giro__id__exact={self.giro_a.pk}"')
+        self.assertContains(response, f'href="?giro__id__exact={self.giro_b.pk}"')
+
+    def test_giro_picker_requires_view_permission(self):
+        self.client.force_login(
+            User.objects.create_user("staff", "staff@example.com", "password", is_staff=True)
+        )
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_with_giro_shows_changelist(self):
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        response = self.client.get(self.url, {"giro__id__exact": self.giro_a.pk})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateNotUsed(response, "admin/core/turno/select_giro.html")
+        self.assertEqual(response.context["cl"].result_count, 1)
+        self.assertEqual(response.context["title"], f"Turni - {self.giro_a}")
+
+
+def _load_dump_script():
+    path = Path(__file__).resolve().parent.parent / "old_data" / "mysql_dump_to_sqlite.py"
+    spec = importlib.util.spec_from_file_location("mysql_dump_to_sqlite", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class MysqlDumpSplitterTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dump = _load_dump_script()
+
+    def split(self, sql: bytes) -> list[bytes]:
+        return list(self.dump.iter_sql_statements(sql))
+
+    def test_semicolons_inside_quotes_do_not_split(self):
+        self.assertEqual(
+            self.split(b"INSERT INTO `a;b` VALUES ('x;y', \"z;w\");\nSELECT 1;"),
+            [b"INSERT INTO `a;b` VALUES ('x;y', \"z;w\");", b"SELECT 1;"],
+        )
+
+    def test_backslash_escapes(self):
+        self.assertEqual(
+            self.split(b"INSERT INTO t VALUES ('it\\'s; ok', 'a\\\\');\nSELECT 2;"),
+            [b"INSERT INTO t VALUES ('it\\'s; ok', 'a\\\\');", b"SELECT 2;"],
+        )
+
+    def test_comment_lines_are_dropped(self):
+        sql = (
+            b"-- phpMyAdmin SQL Dump\n"
+            b"# another comment; with a semicolon\n"
+            b"/*!40101 SET NAMES utf8 */;\n"
+            b"CREATE TABLE t (\n"
+            b"  -- inside the statement\n"
+            b"  a int\n"
+            b");\n"
+            b"SELECT 1; -- trailing comments are kept\n"
+        )
+        self.assertEqual(
+            self.split(sql),
+            [b"CREATE TABLE t (\n  a int\n);", b"SELECT 1;", b"-- trailing comments are kept"],
+        )
+
+    def test_comment_like_lines_inside_quotes_are_kept(self):
+        self.assertEqual(
+            self.split(b"INSERT INTO t VALUES ('first\n-- not a comment\n# nor this');"),
+            [b"INSERT INTO t VALUES ('first\n-- not a comment\n# nor this');"],
+        )
+
+    def test_crlf_line_endings_are_kept(self):
+        self.assertEqual(
+            self.split(b"-- comment\r\n/*!40101 SET x */;\r\nSELECT\r\n1;\r\n"),
+            [b"SELECT\r\n1;"],
+        )
+
+    def test_unterminated_quote_runs_to_the_end(self):
+        self.assertEqual(
+            self.split(b"SELECT 1;\nINSERT INTO t VALUES ('open; never closed);\nSELECT 2;"),
+            [b"SELECT 1;", b"INSERT INTO t VALUES ('open; never closed);\nSELECT 2;"],
+        )
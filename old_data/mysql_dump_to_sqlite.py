@@ -8,9 +8,12 @@ It converts common MySQL-specific syntax to SQLite-compatible SQL on the fly.
 from __future__ import annotations
 
 import argparse
+import mmap
+import os
 import re
 import sqlite3
 from pathlib import Path
+from typing import Iterator
 
 
 IGNORED_PREFIXES = (
@@ -27,222 +30,249 @@ IGNORED_PREFIXES = (
 
 SYSTEM_SCHEMAS = {"information_schema", "mysql", "performance_schema", "sys"}
 
+# Long enough for every prefix convert_statement checks ("CREATE TEMPORARY TABLE").
+_STATEMENT_HEAD_LENGTH = 32
+
+_BACKTICK_TO_DOUBLE_QUOTE = str.maketrans({"`": '"'})
+
+# The whole dump is loaded in a single transaction, so there is nothing to gain
+# from fsyncs or an on-disk rollback journal until the final commit. The
+# journal is kept in memory rather than turned off, so a failed import still
+# rolls back cleanly instead of leaving a half-written database behind.
+_BULK_LOAD_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -200000",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA journal_mode = MEMORY",
+)
+# The other settings above only last for this connection; WAL is the one that
+# is stored in the database file, so it is switched on once the import has
+# committed.
+_FINISHED_DB_PRAGMAS = ("PRAGMA journal_mode = WAL",)
+
+
+# Only full-line comments, quoted strings/identifiers, backslash escapes and
+# ";" matter when splitting; an unterminated quote runs to the end of the text.
+# Comment lines are "--" or "#" lines and versioned "/*! ... */;" directives;
+# they are dropped together with their line break.
+_SQL_TOKEN_RE = re.compile(
+    rb"(?P<comment>^[ \t]*(?:--|\#)[^\n]*\n?|^[ \t]*/\*![^\n]*\*/;[ \t\r]*(?:\n|\Z))"
+    rb"""|\\.|'(?:[^'\\]|\\.)*'?|"(?:[^"\\]|\\.)*"?|`(?:[^`\\]|\\.)*`?"""
+    rb"|(?P<end>;)",
+    re.DOTALL | re.MULTILINE,
+)
 
-def split_sql_statements(sql_text: str) -> list[str]:
-    """Split SQL script into statements, respecting quoted strings/identifiers."""
-    statements: list[str] = []
-    current: list[str] = []
-
-    in_single = False
-    in_double = False
-    in_backtick = False
-    escape = False
-
-    for ch in sql_text:
-        current.append(ch)
-
-        if escape:
-            escape = False
-            continue
-
-        if ch == "\\":
-            escape = True
-            continue
-
-        if in_single:
-            if ch == "'":
-                in_single = False
-            continue
-
-        if in_double:
-            if ch == '"':
-                in_double = False
-            continue
-
-        if in_backtick:
-            if ch == "`":
-                in_backtick = False
-            continue
 
-        if ch == "'":
-            in_single = True
-            continue
+def iter_sql_statements(sql_text: bytes) -> Iterator[bytes]:
+    """Yield stripped statements, skipping comment lines and respecting quoted strings/identifiers."""
+    # Pieces of the current statement; only more than one when a comment line
+    # sits inside the statement.
+    parts: list[bytes] = []
+    start = 0
 
-        if ch == '"':
-            in_double = True
+    for match in _SQL_TOKEN_RE.finditer(sql_text):
+        kind = match.lastgroup
+        if kind is None:
             continue
-
-        if ch == "`":
-            in_backtick = True
+        if kind == "comment":
+            parts.append(sql_text[start : match.start()])
+            start = match.end()
             continue
-
-        if ch == ";":
-            statement = "".join(current).strip()
-            if statement:
-                statements.append(statement)
-            current = []
-
-    leftover = "".join(current).strip()
+        parts.append(sql_text[start : match.end()])
+        statement = b"".join(parts).strip()
+        if statement:
+            yield statement
+        parts = []
+        start = match.end()
+
+    parts.append(sql_text[start:])
+    leftover = b"".join(parts).strip()
     if leftover:
-        statements.append(leftover)
-
-    return statements
-
-
-def strip_comment_lines(sql_text: str) -> str:
-    """Remove full-line MySQL comments and versioned directives."""
-    kept_lines: list[str] = []
-    for line in sql_text.splitlines():
-        stripped = line.strip()
-        if not stripped:
-            kept_lines.append(line)
-            continue
-        if stripped.startswith("--"):
-            continue
-        if stripped.startswith("#"):
-            continue
-        if stripped.startswith("/*!") and stripped.endswith("*/;"):
-            continue
-        kept_lines.append(line)
-    return "\n".join(kept_lines)
+        yield leftover
+
+
+def iter_dump_statements(dump_path: Path) -> Iterator[bytes]:
+    """Yield the statements of a dump file, keeping it memory-mapped only while iterating."""
+    # The dump is scanned as raw bytes straight from the page cache; only the
+    # individual statements are decoded by the caller. This assumes an
+    # ASCII-compatible encoding (latin1, utf-8, ...), which is what phpMyAdmin
+    # produces.
+    with dump_path.open("rb") as dump_file:
+        if os.fstat(dump_file.fileno()).st_size == 0:
+            return  # mmap refuses empty files.
+        with mmap.mmap(dump_file.fileno(), 0, access=mmap.ACCESS_READ) as raw_dump:
+            yield from iter_sql_statements(raw_dump)
+
+
+# One alternation per replacement, so each statement is scanned once per
+# target type instead of once per MySQL spelling.
+_DROPPED_MODIFIERS_RE = re.compile(r"\b(?:unsigned|zerofill)\b", re.IGNORECASE)
+_TEXT_TYPES_RE = re.compile(r"\b(?:enum|set)\s*\((?:[^)(]|\([^)(]*\))*\)", re.IGNORECASE)
+_INTEGER_TYPES_RE = re.compile(
+    r"\b(?:tiny|small|medium|big)?int(?:eger)?\s*\(\s*\d+\s*\)", re.IGNORECASE
+)
+_REAL_TYPES_RE = re.compile(r"\b(?:double|float)\b", re.IGNORECASE)
 
 
 def normalize_types(stmt: str) -> str:
     """Map common MySQL data types/modifiers to SQLite-friendly variants."""
-    stmt = re.sub(r"\bunsigned\b", "", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\bzerofill\b", "", stmt, flags=re.IGNORECASE)
-
-    stmt = re.sub(r"\benum\s*\((?:[^)(]|\([^)(]*\))*\)", "TEXT", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\bset\s*\((?:[^)(]|\([^)(]*\))*\)", "TEXT", stmt, flags=re.IGNORECASE)
-
-    stmt = re.sub(r"\btinyint\s*\(\s*\d+\s*\)", "INTEGER", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\bsmallint\s*\(\s*\d+\s*\)", "INTEGER", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\bmediumint\s*\(\s*\d+\s*\)", "INTEGER", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\bint\s*\(\s*\d+\s*\)", "INTEGER", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\binteger\s*\(\s*\d+\s*\)", "INTEGER", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\bbigint\s*\(\s*\d+\s*\)", "INTEGER", stmt, flags=re.IGNORECASE)
+    stmt = _DROPPED_MODIFIERS_RE.sub("", stmt)
+    stmt = _TEXT_TYPES_RE.sub("TEXT", stmt)
+    stmt = _INTEGER_TYPES_RE.sub("INTEGER", stmt)
+    stmt = _REAL_TYPES_RE.sub("REAL", stmt)
+    return stmt
 
-    stmt = re.sub(r"\bdouble\b", "REAL", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\bfloat\b", "REAL", stmt, flags=re.IGNORECASE)
 
-    return stmt
+_TABLE_AUTO_INCREMENT_RE = re.compile(r"\bAUTO_INCREMENT\s*=\s*\d+\b", re.IGNORECASE)
+_COLUMN_AUTO_INCREMENT_RE = re.compile(r"\s+AUTO_INCREMENT\b", re.IGNORECASE)
+# Index definitions are matched one whole line at a time; [^\S\n] is
+# whitespace that does not cross into the next line.
+_UNIQUE_KEY_LINE_RE = re.compile(
+    r'^[^\S\n]*UNIQUE[^\S\n]+KEY[^\S\n]+"[^"]+"[^\S\n]*\((.+)\)[^\S\n]*(,?)[^\S\n]*$',
+    re.IGNORECASE | re.MULTILINE,
+)
+_PLAIN_KEY_LINE_RE = re.compile(
+    r'^[^\S\n]*KEY[^\S\n]+"[^"]+"[^\S\n]*\(.+\)[^\S\n]*,?[^\S\n]*$\n?',
+    re.IGNORECASE | re.MULTILINE,
+)
+_TABLE_OPTIONS_RE = re.compile(
+    r"\)\s*(?:ENGINE|TYPE|DEFAULT|AUTO_INCREMENT|CHARSET|COLLATE)\b.*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_TRAILING_COMMA_RE = re.compile(r",\s*\)\s*$", re.DOTALL)
 
 
 def convert_create_table(stmt: str) -> str:
     """Convert MySQL CREATE TABLE statement into SQLite-compatible SQL."""
-    stmt = stmt.replace("`", '"')
+    stmt = stmt.translate(_BACKTICK_TO_DOUBLE_QUOTE)
     stmt = normalize_types(stmt)
 
-    stmt = re.sub(r"\bAUTO_INCREMENT\s*=\s*\d+\b", "", stmt, flags=re.IGNORECASE)
-    stmt = re.sub(r"\s+AUTO_INCREMENT\b", "", stmt, flags=re.IGNORECASE)
+    stmt = _TABLE_AUTO_INCREMENT_RE.sub("", stmt)
+    stmt = _COLUMN_AUTO_INCREMENT_RE.sub("", stmt)
 
-    lines = stmt.splitlines()
-    converted_lines: list[str] = []
-
-    for line in lines:
-        stripped = line.strip()
-
-        unique_match = re.match(r'^UNIQUE\s+KEY\s+"[^"]+"\s*\((.+)\)\s*,?$', stripped, flags=re.IGNORECASE)
-        if unique_match:
-            suffix = "," if stripped.endswith(",") else ""
-            converted_lines.append(f"  UNIQUE ({unique_match.group(1)}){suffix}")
-            continue
-
-        plain_key_match = re.match(r'^KEY\s+"[^"]+"\s*\((.+)\)\s*,?$', stripped, flags=re.IGNORECASE)
-        if plain_key_match:
-            continue
-
-        converted_lines.append(line)
-
-    stmt = "\n".join(converted_lines)
+    # UNIQUE KEY lines become table constraints; plain KEY lines are dropped.
+    stmt = _UNIQUE_KEY_LINE_RE.sub(r"  UNIQUE (\1)\2", stmt)
+    stmt = _PLAIN_KEY_LINE_RE.sub("", stmt)
 
     # Strip MySQL table options appended after the closing parenthesis.
     # Example: ") ENGINE=InnoDB DEFAULT CHARSET=latin1 AUTO_INCREMENT=1234"
-    stmt = re.sub(
-        r"\)\s*(?:ENGINE|TYPE|DEFAULT|AUTO_INCREMENT|CHARSET|COLLATE)\b.*$",
-        ")",
-        stmt,
-        flags=re.IGNORECASE | re.DOTALL,
-    )
+    stmt = _TABLE_OPTIONS_RE.sub(")", stmt)
 
-    stmt = re.sub(r",\s*\)\s*$", ")", stmt, flags=re.DOTALL)
+    stmt = _TRAILING_COMMA_RE.sub(")", stmt)
     return stmt
 
 
+# Every prefix convert_statement acts on, as one anchored alternation: a single
+# match on the statement head replaces a chain of startswith() calls, and the
+# name of the matching group says what to do with the statement.
+_STATEMENT_KIND_RE = re.compile(
+    "(?P<ignored>" + "|".join(re.escape(prefix) for prefix in ("/*!", *IGNORED_PREFIXES)) + ")"
+    "|(?P<use>USE )"
+    "|(?P<create_table>CREATE TABLE|CREATE TEMPORARY TABLE)"
+    "|(?P<alter_table>ALTER TABLE)"
+)
+
+
 def convert_statement(stmt: str) -> str | None:
-    stripped = stmt.strip().rstrip(";").strip()
-    upper = stripped.upper()
+    # Statements come already stripped from iter_sql_statements; only the
+    # terminating ";" (and any blanks before it) is left to remove.
+    stripped = stmt.rstrip(";").rstrip()
+    # Only the statement head is classified, so there is no need to upper-case
+    # the whole body of a large multi-row INSERT.
+    upper = stripped[:_STATEMENT_HEAD_LENGTH].upper()
 
-    if upper.startswith("/*!"):
-        return None
+    kind_match = _STATEMENT_KIND_RE.match(upper)
+    kind = kind_match.lastgroup if kind_match else None
 
-    if upper.startswith(IGNORED_PREFIXES):
+    if kind == "ignored" or kind == "alter_table":
         return None
 
-    if upper.startswith("USE "):
+    if kind == "use":
         return stripped
 
-    if upper.startswith("CREATE TABLE") or upper.startswith("CREATE TEMPORARY TABLE"):
+    if kind == "create_table":
         return convert_create_table(stripped)
 
-    if upper.startswith("INSERT INTO"):
-        return stripped.replace("`", '"')
-
-    if upper.startswith("DROP TABLE"):
-        return stripped.replace("`", '"')
+    # INSERT INTO, DROP TABLE and anything else only need identifier quoting.
+    return stripped.translate(_BACKTICK_TO_DOUBLE_QUOTE)
 
-    if upper.startswith("ALTER TABLE"):
-        return None
 
-    return stripped.replace("`", '"')
+_USE_RE = re.compile(r'^USE\s+[`"]?([^`";\s]+)[`"]?\s*;?$', re.IGNORECASE)
 
 
 def extract_use_database(stmt: str) -> str | None:
-    match = re.match(r'^USE\s+[`"]?([^`";\s]+)[`"]?\s*;?$', stmt, flags=re.IGNORECASE)
+    match = _USE_RE.match(stmt)
     return match.group(1) if match else None
 
 
+# (statement number, active schema, converted SQL or None if skipped)
+ConvertedStatement = tuple[int, str | None, str | None]
+
+
+def iter_converted_statements(
+    dump_path: Path,
+    include_schemas: set[str] | None,
+    exclude_system_schemas: bool,
+    encoding: str,
+) -> Iterator[ConvertedStatement]:
+    """Parse, filter and convert every statement of the dump, in order."""
+    active_schema: str | None = None
+
+    for index, raw_statement in enumerate(iter_dump_statements(dump_path), start=1):
+        statement = raw_statement.decode(encoding)
+        # USE is rare; only statements that can be one go through the regex.
+        use_db = extract_use_database(statement) if statement[:3].upper() == "USE" else None
+        if use_db:
+            active_schema = use_db
+            yield index, active_schema, None
+            continue
+
+        # Filtered schemas are dropped before any conversion work is done.
+        if active_schema and include_schemas is not None and active_schema not in include_schemas:
+            yield index, active_schema, None
+            continue
+
+        if active_schema and exclude_system_schemas and active_schema in SYSTEM_SCHEMAS:
+            yield index, active_schema, None
+            continue
+
+        converted = convert_statement(statement)
+        if not converted:
+            yield index, active_schema, None
+            continue
+
+        yield index, active_schema, converted
+
+
 def import_dump(
     dump_path: Path,
     sqlite_path: Path,
     include_schemas: set[str] | None,
     exclude_system_schemas: bool,
     encoding: str,
+    commit_every: int | None = None,
 ) -> tuple[int, int]:
-    raw_text = dump_path.read_text(encoding=encoding)
-    text = strip_comment_lines(raw_text)
-    statements = split_sql_statements(text)
-
     executed = 0
     skipped = 0
-    active_schema: str | None = None
 
     conn = sqlite3.connect(sqlite_path)
+
+    converted_statements = iter_converted_statements(
+        dump_path, include_schemas, exclude_system_schemas, encoding
+    )
+
     try:
-        conn.execute("PRAGMA journal_mode = WAL")
+        for pragma in _BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
         conn.execute("PRAGMA foreign_keys = OFF")
         conn.execute("BEGIN")
 
-        for index, statement in enumerate(statements, start=1):
-            use_db = extract_use_database(statement.strip())
-            if use_db:
-                active_schema = use_db
-                skipped += 1
-                continue
-
-            converted = convert_statement(statement)
+        for index, active_schema, converted in converted_statements:
             if not converted:
                 skipped += 1
                 continue
 
-            if active_schema and include_schemas is not None and active_schema not in include_schemas:
-                skipped += 1
-                continue
-
-            if active_schema and exclude_system_schemas and active_schema in SYSTEM_SCHEMAS:
-                skipped += 1
-                continue
-
             try:
                 conn.execute(converted)
             except sqlite3.Error as exc:
@@ -251,16 +281,34 @@ def import_dump(
                 ) from exc
             executed += 1
 
+            # Optional intermediate commits keep the journal small on huge
+            # dumps, at the price of a failed import keeping what was
+            # committed so far.
+            if commit_every and executed % commit_every == 0:
+                conn.commit()
+                conn.execute("BEGIN")
+
         conn.commit()
+
+        for pragma in _FINISHED_DB_PRAGMAS:
+            conn.execute(pragma)
     except Exception:
         conn.rollback()
         raise
     finally:
+        converted_statements.close()
         conn.close()
 
     return executed, skipped
 
 
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Import a MySQL dump into SQLite")
     parser.add_argument("dump", type=Path, help="Path to .sql dump file")
@@ -281,6 +329,15 @@ def parse_args() -> argparse.Namespace:
         default="latin1",
         help="Input dump encoding (default: latin1).",
     )
+    parser.add_argument(
+        "--commit-every",
+        type=positive_int,
+        metavar="N",
+        help=(
+            "Commit after every N executed statements instead of once at the end. "
+            "Bounds the journal on very large dumps, but a failed import is then only partially rolled back."
+        ),
+    )
     return parser.parse_args()
 
 
@@ -295,6 +352,7 @@ def main() -> None:
         include_schemas=include_schemas,
         exclude_system_schemas=not args.include_system_schemas,
         encoding=args.encoding,
+        commit_every=args.commit_every,
     )
 
     print(f"Imported into: {args.sqlite}")